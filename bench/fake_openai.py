@@ -0,0 +1,172 @@
+"""Local stand-in for the OpenAI chat completions API, for offline benchmarks.
+
+Answers POST /v1/chat/completions with valid LanguagePairs (or
+LanguagePairRounds) payloads after a log-normally distributed delay, and fails
+a configurable fraction of calls. Point the app at it with
+OPENAI_BASE_URL=http://127.0.0.1:<port>/v1 and any OPENAI_API_KEY.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import math
+import random
+import re
+import string
+import sys
+import time
+import uuid
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    # Set on the server by make_server
+    median_latency = 1.0
+    latency_sigma = 0.5
+    error_rate = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+            return
+
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        time.sleep(self.median_latency * math.exp(random.gauss(0, self.latency_sigma)))
+
+        if random.random() < self.error_rate:
+            status = random.choice([429, 500, 503])
+            self.send_json(status, {"error": {"message": "Injected failure", "type": "server_error"}})
+            return
+
+        content = json.dumps(fake_content(body))
+        usage = fake_usage(body, content)
+        if body.get("stream"):
+            self.send_stream(body, content, usage)
+        else:
+            self.send_json(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "fake"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content, "refusal": None},
+                    "finish_reason": "stop",
+                    "logprobs": None,
+                }],
+                "usage": usage,
+            })
+
+    def send_json(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_stream(self, body, content, usage):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+        base = {"id": chunk_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": body.get("model", "fake")}
+        deltas = [{"role": "assistant", "content": ""}] + [{"content": content[i:i + 16]} for i in range(0, len(content), 16)]
+        for delta in deltas:
+            self.send_event({**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None, "logprobs": None}]})
+        self.send_event({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop", "logprobs": None}]})
+        if body.get("stream_options", {}).get("include_usage"):
+            self.send_event({**base, "choices": [], "usage": usage})
+        self.send_chunk(b"data: [DONE]\n\n")
+        self.send_chunk(b"")
+
+    def send_event(self, payload):
+        self.send_chunk(f"data: {json.dumps(payload)}\n\n".encode())
+
+    def send_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+def fake_content(body):
+    prompt = "\n".join(message.get("content", "") for message in body.get("messages", []))
+    pairs_match = re.search(r"^Pairs(?: per round)?: (\d+)", prompt, re.MULTILINE)
+    n = int(pairs_match.group(1)) if pairs_match else 5
+
+    json_schema = body.get("response_format", {}).get("json_schema", {})
+    if json_schema.get("name", "") == "LanguagePairRounds":
+        rounds_match = re.search(r"^Rounds: (\d+)", prompt, re.MULTILINE)
+        rounds = int(rounds_match.group(1)) if rounds_match else 1
+        return {"rounds": [fake_board(n) for _ in range(rounds)]}
+    # Keys come out in schema order, like a real model filling in a structured output
+    board = fake_board(n)
+    return {key: board[key] for key in json_schema.get("schema", {}).get("properties", board) if key in board}
+
+
+def fake_board(n):
+    # Random letters so pairs aren't near-duplicates of each other
+    return {
+        "representative_story": f"A short story {fake_word()} that ties the words together.",
+        "pairs": [{"L1": fake_word(), "L2": fake_word()} for _ in range(n)],
+    }
+
+
+def fake_word():
+    return "".join(random.choices(string.ascii_lowercase, k=random.randint(4, 10)))
+
+
+def fake_usage(body, content):
+    # Roughly four characters per token; the fixed system prompt counts as cached, in 128 token
+    # steps, once it reaches the 1024 token minimum. Check real counts with a tokenizer, this overestimates.
+    messages = body.get("messages", [])
+    prompt_tokens = sum(len(message.get("content", "")) for message in messages) // 4
+    prefix_tokens = len(messages[0].get("content", "")) // 4 if messages else 0
+    cached_tokens = prefix_tokens // 128 * 128 if prefix_tokens >= 1024 else 0
+    completion_tokens = len(content) // 4
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_tokens_details": {"cached_tokens": cached_tokens},
+    }
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up mid-response (timeouts, cancelled hedges, shutdown) are expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def make_server(host, port, median_latency, latency_sigma, error_rate):
+    handler = type("ConfiguredHandler", (FakeOpenAIHandler,), {
+        "median_latency": median_latency,
+        "latency_sigma": latency_sigma,
+        "error_rate": error_rate,
+    })
+    return FakeOpenAIServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--median-latency", type=float, default=1.0, help="Median response delay in seconds.")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Log-normal sigma of the delay; 0 for a fixed delay.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls answered with 429/500/503.")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.median_latency, args.latency_sigma, args.error_rate)
+    print(f"Fake OpenAI API on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Drive POST /generate, /generate/batch or /generate/stream at fixed concurrency levels and report throughput and latency.
+
+For each (concurrency, n) combination, `concurrency` workers send requests
+back to back for `duration` seconds. Latency percentiles cover every request;
+error rate counts non-2xx responses, transport failures and streams that end
+in an error line. Streams also report the median time to their first line.
+With `sessions`, workers send one of that many session ids so the dedup
+window is exercised.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import itertools
+import json
+import time
+import urllib.error
+import urllib.request
+
+
+ENDPOINTS = {"generate": "/generate", "batch": "/generate/batch", "stream": "/generate/stream"}
+
+
+def send_request(url, body, stream, timeout):
+    """Returns (latency, latency to the first streamed line or None, ok)."""
+    req = urllib.request.Request(url, data=json.dumps(body).encode(), headers={"Content-Type": "application/json"}, method="POST")
+    start = time.perf_counter()
+    first = None
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            ok = 200 <= response.status < 300
+            if stream:
+                last = b"{}"
+                for line in response:
+                    if first is None:
+                        first = time.perf_counter() - start
+                    if line.strip():
+                        last = line
+                # Failures after the stream started arrive as a final {"error": ...} line
+                ok = ok and json.loads(last).get("done", False)
+            else:
+                response.read()
+    except (urllib.error.URLError, OSError, ValueError):
+        ok = False
+    return time.perf_counter() - start, first, ok
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def run_level(url, endpoint, concurrency, n, duration, L1_language, L2_language, reading_level, rounds, sessions, timeout):
+    deadline = time.perf_counter() + duration
+    body = {"L1_language": L1_language, "L2_language": L2_language, "n": n, "reading_level": reading_level}
+    if endpoint == "batch":
+        body["rounds"] = rounds
+
+    def worker(index):
+        worker_body = {**body, "session_id": f"bench-{index % sessions}"} if sessions else body
+        samples = []
+        while time.perf_counter() < deadline:
+            samples.append(send_request(url + ENDPOINTS[endpoint], worker_body, endpoint == "stream", timeout))
+        return samples
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(itertools.chain.from_iterable(pool.map(worker, range(concurrency))))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, _, _ in results)
+    first_lines = sorted(first for _, first, ok in results if ok and first is not None)
+    errors = sum(1 for _, _, ok in results if not ok)
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "n": n,
+        "requests": len(results),
+        "throughput_rps": len(results) / elapsed if elapsed else 0.0,
+        "p50_seconds": percentile(latencies, 50),
+        "p95_seconds": percentile(latencies, 95),
+        "p99_seconds": percentile(latencies, 99),
+        "p50_first_line_seconds": percentile(first_lines, 50),
+        "error_rate": errors / len(results) if results else 0.0,
+    }
+
+
+def format_report(rows):
+    header = f"{'endpoint':>8} {'conc':>5} {'n':>4} {'reqs':>6} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'1st p50':>8} {'errors':>7}"
+    lines = [header, "-" * len(header)]
+    for row in rows:
+        lines.append(
+            f"{row['endpoint']:>8} {row['concurrency']:>5} {row['n']:>4} {row['requests']:>6} {row['throughput_rps']:>8.2f} "
+            f"{format_seconds(row['p50_seconds'])} {format_seconds(row['p95_seconds'])} {format_seconds(row['p99_seconds'])} "
+            f"{format_seconds(row['p50_first_line_seconds'])} {row['error_rate']:>7.1%}"
+        )
+    return "\n".join(lines)
+
+
+def format_seconds(value):
+    return f"{'-':>8}" if value is None else f"{value:>7.3f}s"
+
+
+def run(url, concurrency_levels, n_values, duration, endpoint="generate", L1_language="English", L2_language="Spanish",
+        reading_level="beginner", rounds=3, sessions=0, timeout=60.0):
+    return [
+        run_level(url, endpoint, concurrency, n, duration, L1_language, L2_language, reading_level, rounds, sessions, timeout)
+        for concurrency, n in itertools.product(concurrency_levels, n_values)
+    ]
+
+
+def add_workload_arguments(parser):
+    parser.add_argument("--endpoint", choices=sorted(ENDPOINTS), default="generate")
+    parser.add_argument("--rounds", type=int, default=3, help="Rounds per request for --endpoint batch.")
+    parser.add_argument("--sessions", type=int, default=0, help="Distinct session ids to send; 0 sends none.")
+
+
+def int_list(value):
+    return [int(item) for item in value.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="Base URL of the app.")
+    parser.add_argument("--concurrency", type=int_list, default=[1, 4, 16], help="Comma separated concurrency levels.")
+    parser.add_argument("--n", type=int_list, default=[5, 10], help="Comma separated board sizes.")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to run each combination.")
+    add_workload_arguments(parser)
+    parser.add_argument("--L1", default="English")
+    parser.add_argument("--L2", default="Spanish")
+    parser.add_argument("--reading-level", default="beginner")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    args = parser.parse_args()
+
+    rows = run(args.url.rstrip("/"), args.concurrency, args.n, args.duration, args.endpoint, args.L1, args.L2, args.reading_level,
+               args.rounds, args.sessions, args.timeout)
+    print(json.dumps(rows, indent=2) if args.json else format_report(rows))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Run the full offline benchmark: fake OpenAI API, the app, and the load generator.
+
+    python bench/run.py --mode sync --concurrency 1,8,32 --n 5,10
+    python bench/run.py --mode async --endpoint stream --sessions 8 --no-cache
+
+The app runs in a subprocess pointed at the fake API with a throwaway corpus,
+so results aren't skewed by boards left over from earlier runs. Within a run
+the corpus and pool soon serve most requests; --no-cache turns both off so
+every request reaches the (fake) upstream. Pool, corpus and serving settings
+are otherwise taken from the environment as usual.
+"""
+from pathlib import Path
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import fake_openai
+import loadgen
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"App did not start listening on port {port}")
+
+
+def app_command(mode, port):
+    if mode == "async":
+        return [sys.executable, "-m", "hypercorn", "serve:app", "--bind", f"127.0.0.1:{port}"]
+    return [sys.executable, "-m", "flask", "--app", "main", "run", "--port", str(port), "--no-reload"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=["sync", "async"], default="sync", help="Serve with main.py (Flask) or serve.py (ASGI).")
+    parser.add_argument("--concurrency", type=loadgen.int_list, default=[1, 4, 16])
+    parser.add_argument("--n", type=loadgen.int_list, default=[5, 10])
+    parser.add_argument("--duration", type=float, default=10.0)
+    loadgen.add_workload_arguments(parser)
+    parser.add_argument("--no-cache", action="store_true", help="Disable the corpus and the pool of ready boards.")
+    parser.add_argument("--median-latency", type=float, default=1.0)
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    args = parser.parse_args()
+
+    fake = fake_openai.make_server("127.0.0.1", 0, args.median_latency, args.latency_sigma, args.error_rate)
+    threading.Thread(target=fake.serve_forever, daemon=True).start()
+
+    port = free_port()
+    with tempfile.TemporaryDirectory() as scratch:
+        env = {
+            **os.environ,
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{fake.server_address[1]}/v1",
+            "OPENAI_API_KEY": "offline-benchmark",
+            "CORPUS_PATH": os.path.join(scratch, "corpus.sqlite3"),
+        }
+        if args.no_cache:
+            # The corpus never has enough pairs to assemble a board, and the pool never refills
+            env.update({"CORPUS_MIN_FACTOR": "1000000", "POOL_LOW_WATER": "0"})
+        app = subprocess.Popen(app_command(args.mode, port), cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for_port(port)
+            rows = loadgen.run(f"http://127.0.0.1:{port}", args.concurrency, args.n, args.duration, args.endpoint,
+                               rounds=args.rounds, sessions=args.sessions)
+        finally:
+            app.terminate()
+            app.wait()
+            fake.shutdown()
+
+    print(json.dumps(rows, indent=2) if args.json else loadgen.format_report(rows))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+from datetime import datetime, timezone
+import hashlib
+import json
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS boards (
+    id INTEGER PRIMARY KEY,
+    l1_language TEXT NOT NULL,
+    l2_language TEXT NOT NULL,
+    reading_level TEXT NOT NULL,
+    categories TEXT NOT NULL,
+    representative_story TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    fingerprint TEXT
+);
+CREATE TABLE IF NOT EXISTS pairs (
+    id INTEGER PRIMARY KEY,
+    board_id INTEGER NOT NULL REFERENCES boards(id),
+    l1_language TEXT NOT NULL,
+    l2_language TEXT NOT NULL,
+    reading_level TEXT NOT NULL,
+    L1 TEXT NOT NULL,
+    L2 TEXT NOT NULL,
+    served_count INTEGER NOT NULL DEFAULT 0,
+    last_served_at TEXT,
+    UNIQUE (l1_language, l2_language, reading_level, L1, L2)
+);
+CREATE INDEX IF NOT EXISTS pairs_by_key
+    ON pairs (l1_language, l2_language, reading_level, served_count);
+"""
+
+# Corpora created before boards had a fingerprint get the column added on open.
+FINGERPRINT_INDEX = "CREATE UNIQUE INDEX IF NOT EXISTS boards_by_fingerprint ON boards (fingerprint)"
+
+
+class PairCorpus:
+    """On-disk store of every generated pair, used to assemble boards without a model call.
+
+    Pairs are indexed by (L1 language, L2 language, reading level). A board is
+    only assembled when the key has at least `min_factor * n` stored pairs and
+    none of the chosen pairs has been served more than `max_repeats` times.
+    Boards are identified by a fingerprint of their key, story and pairs, so
+    adding or importing the same board twice stores it once.
+    """
+
+    def __init__(self, path, min_factor=3, max_repeats=3):
+        self.min_factor = min_factor
+        self.max_repeats = max_repeats
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(SCHEMA)
+        columns = [row["name"] for row in self._conn.execute("PRAGMA table_info(boards)")]
+        if "fingerprint" not in columns:
+            self._conn.execute("ALTER TABLE boards ADD COLUMN fingerprint TEXT")
+        self._conn.execute(FINGERPRINT_INDEX)
+
+    def add_board(self, L1_language, L2_language, reading_level, categories, board):
+        with self._lock, self._conn:
+            self._insert_board(L1_language, L2_language, reading_level, categories, board)
+
+    def assemble(self, L1_language, L2_language, reading_level, n):
+        """Return a fresh board of `n` stored pairs, or None if the corpus can't supply one."""
+        key = (L1_language, L2_language, reading_level)
+        with self._lock, self._conn:
+            (available,) = self._conn.execute(
+                "SELECT COUNT(*) FROM pairs WHERE l1_language = ? AND l2_language = ? AND reading_level = ?",
+                key,
+            ).fetchone()
+            if available < self.min_factor * n:
+                return None
+
+            # Least served first; random among ties so boards differ.
+            rows = self._conn.execute(
+                "SELECT id, board_id, L1, L2, served_count FROM pairs "
+                "WHERE l1_language = ? AND l2_language = ? AND reading_level = ? "
+                "ORDER BY served_count, RANDOM() LIMIT ?",
+                (*key, self.min_factor * n),
+            ).fetchall()
+
+            # Both sides must be unique within a board, otherwise a match is ambiguous.
+            chosen, seen_L1, seen_L2 = [], set(), set()
+            for row in rows:
+                if row["L1"] in seen_L1 or row["L2"] in seen_L2:
+                    continue
+                chosen.append(row)
+                seen_L1.add(row["L1"])
+                seen_L2.add(row["L2"])
+                if len(chosen) == n:
+                    break
+
+            if len(chosen) < n or chosen[-1]["served_count"] >= self.max_repeats:
+                return None
+
+            now = datetime.now(timezone.utc).isoformat()
+            self._conn.executemany(
+                "UPDATE pairs SET served_count = served_count + 1, last_served_at = ? WHERE id = ?",
+                [(now, row["id"]) for row in chosen],
+            )
+            # Replacement pairs are stored on boards without a story, so pick one that has one.
+            board_ids = list({row["board_id"] for row in chosen})
+            story = self._conn.execute(
+                f"SELECT representative_story FROM boards WHERE id IN ({', '.join('?' * len(board_ids))}) "
+                "AND representative_story != '' ORDER BY RANDOM() LIMIT 1",
+                board_ids,
+            ).fetchone()
+
+        return {
+            "representative_story": story[0] if story else "",
+            "pairs": [{"L1": row["L1"], "L2": row["L2"]} for row in chosen],
+        }
+
+    def candidates(self, L1_language, L2_language, reading_level, limit):
+        """Up to `limit` stored pairs that can still be served, least served first, without marking them served."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT L1, L2 FROM pairs "
+                "WHERE l1_language = ? AND l2_language = ? AND reading_level = ? AND served_count < ? "
+                "ORDER BY served_count, RANDOM() LIMIT ?",
+                (L1_language, L2_language, reading_level, self.max_repeats, limit),
+            ).fetchall()
+        return [{"L1": row["L1"], "L2": row["L2"]} for row in rows]
+
+    def mark_served(self, L1_language, L2_language, reading_level, pairs):
+        """Count stored pairs (e.g. from `candidates`) as served once more."""
+        if not pairs:
+            return
+        now = datetime.now(timezone.utc).isoformat()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE pairs SET served_count = served_count + 1, last_served_at = ? "
+                "WHERE l1_language = ? AND l2_language = ? AND reading_level = ? AND L1 = ? AND L2 = ?",
+                [(now, L1_language, L2_language, reading_level, pair["L1"], pair["L2"]) for pair in pairs],
+            )
+
+    def export_jsonl(self, fp):
+        """Write one JSON board per line to `fp`. Returns the number of boards written."""
+        count = 0
+        with self._lock:
+            boards = self._conn.execute("SELECT * FROM boards ORDER BY id").fetchall()
+            for board in boards:
+                pairs = self._conn.execute(
+                    "SELECT L1, L2, served_count, last_served_at FROM pairs WHERE board_id = ? ORDER BY id", (board["id"],)
+                ).fetchall()
+                fp.write(json.dumps({
+                    "L1_language": board["l1_language"],
+                    "L2_language": board["l2_language"],
+                    "reading_level": board["reading_level"],
+                    "categories": json.loads(board["categories"]),
+                    "representative_story": board["representative_story"],
+                    "pairs": [dict(pair) for pair in pairs],
+                }, ensure_ascii=False) + "\n")
+                count += 1
+        return count
+
+    def import_jsonl(self, fp):
+        """Load boards written by `export_jsonl`. Returns the number of boards that weren't already stored.
+
+        Served counts in the file are kept, and never lower the counts of pairs already stored.
+        """
+        count = 0
+        with self._lock, self._conn:
+            for line in fp:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                count += self._insert_board(
+                    record["L1_language"],
+                    record["L2_language"],
+                    record["reading_level"],
+                    record.get("categories", []),
+                    record,
+                )
+        return count
+
+    def stats(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT l1_language, l2_language, reading_level, COUNT(*) AS pairs, SUM(served_count) AS served "
+                "FROM pairs GROUP BY l1_language, l2_language, reading_level"
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    # Expects self._lock to be held inside a transaction. Returns False if the board was already stored.
+    def _insert_board(self, L1_language, L2_language, reading_level, categories, board):
+        cursor = self._conn.execute(
+            "INSERT OR IGNORE INTO boards "
+            "(l1_language, l2_language, reading_level, categories, representative_story, created_at, fingerprint) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                L1_language,
+                L2_language,
+                reading_level,
+                json.dumps(list(categories)),
+                board["representative_story"],
+                datetime.now(timezone.utc).isoformat(),
+                board_fingerprint(L1_language, L2_language, reading_level, board),
+            ),
+        )
+        if cursor.rowcount == 0:
+            return False
+
+        # Pairs we already have keep their original board; their served count only goes up.
+        self._conn.executemany(
+            "INSERT INTO pairs (board_id, l1_language, l2_language, reading_level, L1, L2, served_count, last_served_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (l1_language, l2_language, reading_level, L1, L2) DO UPDATE SET "
+            "served_count = MAX(served_count, excluded.served_count), "
+            "last_served_at = NULLIF(MAX(COALESCE(last_served_at, ''), COALESCE(excluded.last_served_at, '')), '')",
+            [
+                (
+                    cursor.lastrowid, L1_language, L2_language, reading_level, pair["L1"], pair["L2"],
+                    pair.get("served_count", 0), pair.get("last_served_at"),
+                )
+                for pair in board["pairs"]
+            ],
+        )
+        return True
+
+
+def board_fingerprint(L1_language, L2_language, reading_level, board):
+    pairs = sorted((pair["L1"], pair["L2"]) for pair in board["pairs"])
+    key = json.dumps([L1_language, L2_language, reading_level, board["representative_story"], pairs], ensure_ascii=False)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
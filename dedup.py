@@ -0,0 +1,131 @@
+from collections import OrderedDict
+import numpy as np
+import re
+import threading
+
+MERSENNE_PRIME = (1 << 31) - 1
+
+
+class NotEnoughPairs(Exception):
+    pass
+
+
+class PairFilter:
+    """Rejects near-duplicate pairs within a board and pairs served recently for the same key.
+
+    Each side of a pair (L1 and L2) gets a MinHash signature over character
+    n-grams, so similarity is the fraction of matching signature slots. A pair
+    is a near-duplicate when both sides reach `threshold` against another pair,
+    or when either side is identical, since two cards with the same text make
+    a match ambiguous. Callers can pass a per-call `threshold`, as harder levels
+    want similar but distinct pairs. Every key keeps a ring buffer of the last
+    `window` served pairs (their text, plus 2 * `num_hashes` uint32 values
+    each), and the least recently used keys are dropped past `max_keys`. A key
+    of None has no window, so only pairs within the same board (and `accepted`)
+    are compared.
+    """
+
+    def __init__(self, num_hashes=32, ngram=3, threshold=0.6, window=500, max_keys=1024, seed=0):
+        self.ngram = ngram
+        self.threshold = threshold
+        self.window = window
+        self.max_keys = max_keys
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, MERSENNE_PRIME, size=(num_hashes, 1), dtype=np.uint64)
+        self._b = rng.integers(0, MERSENNE_PRIME, size=(num_hashes, 1), dtype=np.uint64)
+        self._powers = np.array([pow(257, ngram - 1 - i, MERSENNE_PRIME) for i in range(ngram)], dtype=np.uint64)
+
+        self._lock = threading.Lock()
+        # key -> [signatures (window, 2, num_hashes), filled slots, next slot to overwrite, pairs (window,)]
+        self._windows = OrderedDict()
+
+    def select(self, key, pairs, accepted=(), threshold=None):
+        """Return the pairs that aren't near-duplicates of an earlier pair, of `accepted`, or of recent pairs for `key`."""
+        if not pairs:
+            return []
+        if threshold is None:
+            threshold = self.threshold
+
+        signatures = self.signatures(pairs)
+        # A pair loses to any earlier pair in the same list it resembles.
+        duplicate = np.triu(self._similar(signatures, signatures, threshold), k=1).any(axis=0)
+
+        previous = [self.signatures(list(accepted))] if accepted else []
+        if key is not None:
+            with self._lock:
+                window = self._windows.get(key)
+                if window is not None:
+                    self._windows.move_to_end(key)
+                    previous.append(window[0][:window[1]].copy())
+        if previous:
+            duplicate |= self._similar(signatures, np.concatenate(previous), threshold).any(axis=1)
+
+        return [pair for pair, rejected in zip(pairs, duplicate) if not rejected]
+
+    def remember(self, key, pairs):
+        """Add served pairs to the sliding window for `key`, evicting the oldest ones."""
+        if not pairs or key is None:
+            return
+
+        pairs = list(pairs)[-self.window:]
+        signatures = self.signatures(pairs)
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None:
+                window = self._windows[key] = [np.zeros((self.window, 2, len(self._a)), dtype=np.uint32), 0, 0, [None] * self.window]
+                while len(self._windows) > self.max_keys:
+                    self._windows.popitem(last=False)
+            else:
+                self._windows.move_to_end(key)
+
+            slots = (window[2] + np.arange(len(signatures))) % self.window
+            window[0][slots] = signatures
+            for slot, pair in zip(slots, pairs):
+                window[3][slot] = {"L1": pair["L1"], "L2": pair["L2"]}
+            window[1] = min(self.window, window[1] + len(signatures))
+            window[2] = int(slots[-1] + 1) % self.window
+
+    def recent(self, key, limit):
+        """The last `limit` pairs remembered for `key`, most recent first."""
+        if key is None or limit <= 0:
+            return []
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None:
+                return []
+            count = min(limit, window[1])
+            return [window[3][(window[2] - 1 - i) % self.window] for i in range(count)]
+
+    def signatures(self, pairs):
+        """MinHash signatures for a list of pairs, shaped (len(pairs), 2, num_hashes)."""
+        texts = [self._normalize(pair[side]) for pair in pairs for side in ("L1", "L2")]
+        return self._minhash(texts).reshape(len(pairs), 2, -1)
+
+    def _normalize(self, text):
+        text = re.sub(r"[^\w\s]", "", text.casefold())
+        # Pad so short words still produce n-grams and word edges count
+        return " " + " ".join(text.split()).ljust(self.ngram - 1) + " "
+
+    def _minhash(self, texts):
+        # Hash every n-gram of every text in one pass over the concatenated code points.
+        lengths = np.array([len(text) for text in texts])
+        codes = np.frombuffer("".join(texts).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        owner = np.repeat(np.arange(len(texts)), lengths)
+
+        count = len(codes) - self.ngram + 1
+        windows = np.lib.stride_tricks.sliding_window_view(codes, self.ngram)[:count]
+        shingles = (windows % MERSENNE_PRIME * self._powers).sum(axis=1) % MERSENNE_PRIME
+
+        # Drop n-grams that straddle two texts
+        valid = owner[:count] == owner[self.ngram - 1:]
+        shingles, owner = shingles[valid], owner[:count][valid]
+
+        hashed = (self._a * shingles + self._b) % MERSENNE_PRIME
+        starts = np.searchsorted(owner, np.arange(len(texts)))
+        return np.minimum.reduceat(hashed, starts, axis=1).T.astype(np.uint32)
+
+    def _similar(self, left, right, threshold):
+        """(len(left), len(right)) mask of pairs whose sides both reach `threshold`, or that share a side."""
+        matches = (left[:, None, :, :] == right[None, :, :, :]).mean(axis=-1)
+        return (matches >= threshold).all(axis=-1) | (matches == 1.0).any(axis=-1)
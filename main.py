@@ -1,8 +1,19 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify
 from pydantic import BaseModel
 from enum import Enum
-from openai import OpenAI
+from openai import APITimeoutError, OpenAI
+from pool import PairPool
+from corpus import PairCorpus
+from usage import UsageTracker
+from metrics import Metrics, RequestProfiler
+from upstream import DeadlineExceeded, HedgedCaller
+from dedup import NotEnoughPairs, PairFilter
+from contextlib import nullcontext
+import click
+import json
+import os
 import random
+import time
 
 app = Flask(__name__)
 
@@ -195,6 +206,26 @@ class LanguagePairs(BaseModel):
     representative_story: str
     pairs: list[Pair]
 
+# Streamed boards put the pairs first so the first one can be shown before the story is written
+class StreamedLanguagePairs(BaseModel):
+    pairs: list[Pair]
+    representative_story: str
+
+class LanguagePairRounds(BaseModel):
+    rounds: list[LanguagePairs]
+
+class ReplacementPairs(BaseModel):
+    pairs: list[Pair]
+
+def response_format(model: type[BaseModel]) -> dict:
+    """Strict structured output format for `model`, for calls that validate the raw content themselves."""
+    schema = model.model_json_schema()
+    for definition in [schema, *schema.get("$defs", {}).values()]:
+        definition["additionalProperties"] = False
+    return {"type": "json_schema", "json_schema": {"name": model.__name__, "strict": True, "schema": schema}}
+
+LANGUAGE_PAIRS_FORMAT = response_format(LanguagePairs)
+
 # Reading level Enum
 class ReadingLevel(str, Enum):
     beginner = "beginner"
@@ -216,57 +247,474 @@ class ReadingLevel(str, Enum):
 
 # Initialize OpenAI client
 client = OpenAI()
+MODEL = os.environ.get("OPENAI_MODEL", "gpt-4o-2024-11-20")
+MAX_BATCH_ROUNDS = int(os.environ.get("MAX_BATCH_ROUNDS", 5))
+
+# Board generations share a deadline, get hedged when slow and retried on transient errors
+upstream_caller = HedgedCaller(
+    MODEL,
+    hedge_model=os.environ.get("UPSTREAM_HEDGE_MODEL") or None,
+    deadline=float(os.environ.get("UPSTREAM_DEADLINE", 30.0)),
+    hedge_percentile=float(os.environ.get("UPSTREAM_HEDGE_PERCENTILE", 90)),
+    hedge_delay=float(os.environ.get("UPSTREAM_HEDGE_DELAY", 10.0)),
+    max_retries=int(os.environ.get("UPSTREAM_MAX_RETRIES", 2)),
+    max_sync_hedges=int(os.environ.get("UPSTREAM_MAX_SYNC_HEDGES", 4)),
+)
+
+# Near-duplicates within a board and pairs a session saw recently are swapped out
+pair_filter = PairFilter(
+    window=int(os.environ.get("DEDUP_WINDOW", 500)),
+    max_keys=int(os.environ.get("DEDUP_MAX_KEYS", 1024)),
+)
+# Harder levels ask for similar options on purpose, so only near-identical pairs count as duplicates there
+DEDUP_THRESHOLDS = {
+    level: float(os.environ.get(f"DEDUP_THRESHOLD_{level.name.upper()}", default))
+    for level, default in zip(ReadingLevel, (0.6, 0.7, 0.9, 0.9, 0.9))
+}
+DEDUP_REPLACEMENT_ATTEMPTS = int(os.environ.get("DEDUP_REPLACEMENT_ATTEMPTS", 2))
+# Recently served pairs listed in a replacement request so the model doesn't offer them again
+DEDUP_RECENT_EXCLUDE = int(os.environ.get("DEDUP_RECENT_EXCLUDE", 50))
+
+# Token counts (including cached prompt tokens) and latency of every model call
+usage_tracker = UsageTracker()
+
+# Prometheus metrics for /generate, broken down by pipeline phase
+metrics = Metrics()
+metrics.describe("matching_generate_requests_total", "counter", "Requests to /generate by status.")
+metrics.describe("matching_generate_request_seconds", "histogram", "End to end /generate latency.")
+metrics.describe("matching_generate_phase_seconds", "histogram", "Time spent in each phase of board generation.")
+metrics.describe("matching_generate_errors_total", "counter", "Failed /generate requests by exception type.")
+
+# Profile requests sent with "X-Profile: 1", plus a random sample, and keep the slow ones
+profiler = RequestProfiler(
+    os.environ.get("PROFILE_DIR", "profiles"),
+    sample_rate=float(os.environ.get("PROFILE_SAMPLE_RATE", 0.0)),
+    slow_seconds=float(os.environ.get("PROFILE_SLOW_SECONDS", 5.0)),
+)
+
+# Metric labels only take values from these sets so clients can't create unbounded series
+METRIC_LANGUAGES = {
+    "English", "Spanish", "French", "German", "Italian", "Portuguese", "Dutch", "Russian", "Chinese", "Japanese",
+    "Korean", "Arabic", "Hebrew", "Hindi", "Bengali", "Urdu", "Thai", "Vietnamese", "Swedish", "Norwegian", "Danish",
+    "Finnish", "Turkish", "Polish", "Greek", "Czech", "Hungarian", "Romanian", "Swahili", "Malay", "Tagalog",
+}
+METRIC_MAX_N = 20
+
+def generation_labels(L1_language: str, L2_language: str, n: int, reading_level: ReadingLevel) -> dict:
+    languages = [language if language in METRIC_LANGUAGES else "other" for language in (L1_language, L2_language)]
+    return {"level": reading_level.value, "languages": ":".join(languages), "n": str(n) if n <= METRIC_MAX_N else "other"}
+
+def timed_phase(phase: str, labels: dict | None):
+    # Work no request is waiting on (pool refills, warm-up) passes no labels and isn't timed
+    if labels is None:
+        return nullcontext()
+    return metrics.time("matching_generate_phase_seconds", {**labels, "phase": phase})
+
+# Every generated pair is kept so later boards can be assembled without a model call
+corpus = PairCorpus(
+    os.environ.get("CORPUS_PATH", "corpus.sqlite3"),
+    min_factor=int(os.environ.get("CORPUS_MIN_FACTOR", 3)),
+    max_repeats=int(os.environ.get("CORPUS_MAX_REPEATS", 3)),
+)
+
+# Create an instruction informing the system on all reading levels, by joining the descriptions of each level (and their idnetifier)
+levels = "\n".join([f"{level.value}: {level.description()}" for level in ReadingLevel])
+
+# Making real progress. The problem is that especially past basic, the options are SO different that I can guess based off of a single word. That means that as the sentences become more complex, the differencs should be more subtle.
+# The system prompt is identical for every request so the provider can cache it as a prefix; everything that varies goes in the user message.
+# Caching only applies to prefixes of at least 1024 tokens, and this one is about 1,200 (o200k_base), so check the count after trimming it.
+system_prompt = {
+    "role": "system",
+    "content": f"""You are a helpful assistant specializing in generating pairs of words, phrases, and/or sentences in two different languages for a matching game. Each request gives you the two languages to use (L1 and L2), the skill level, the number of pairs and a selection of categories from the catalog below to draw from.
+
+Rules for every pair:
+- L1 is written in the L1 language and L2 is its translation in the L2 language. Make sure that each pair translates properly between L1 and L2, in meaning as well as in register.
+- Align with the skill level details below for length, vocabulary and grammar, and respect the skill level for every pair, not just most of them.
+- Draw the content from the given categories, spreading the pairs across them rather than using only one.
+- No two pairs may share the same L1 text or the same L2 text, otherwise the learner can't tell which match is right.
+- Follow the skill level's guidance on how similar the options should be. From intermediate up, pairs should differ in small but meaningful ways (a tense, a preposition, a word order, a near-synonym) so the learner has to read each one carefully; they must still never be exact repeats.
+- Use natural, idiomatic usage in each language with correct spelling, accents, capitalisation and script. Do not add transliterations, notes or explanations to either side.
+
+Tasks:
+- board: write a representative story that uses the categories, then generate the requested number of matching pairs.
+- board, pairs first: generate the requested number of matching pairs first, then write a representative story that ties them together.
+- rounds: produce exactly the requested number of independent rounds, in order. For each round write a representative story using only that round's categories and then generate the requested number of pairs for it. Do not repeat pairs across rounds.
+- replacement: do not write a story; only generate the requested number of pairs. None of them may repeat any of the existing pairs listed in the request, on either side.
+
+Skill level details:
+{levels}
 
-def generate_language_pairs(L1_language: str, L2_language: str, n: int, reading_level: ReadingLevel) -> dict:
-    # Prepare OpenAI API call
+Category catalog:
+{', '.join(dict.fromkeys(categories))}
+"""
+}
 
+def build_messages(L1_language: str, L2_language: str, n: int, reading_level: ReadingLevel, story_last: bool = False) -> tuple[list[str], list[dict]]:
     selected_categories = random.sample(categories, 8)
-    
-    # Create an instruction informing the system on all reading levels, by joining the descriptions of each level (and their idnetifier)
-    levels = "\n".join([f"{level.value}: {level.description()}" for level in ReadingLevel])
 
-    # Making real progress. The problem is that especially past basic, the options are SO different that I can guess based off of a single word. That means that as the sentences become more complex, the differencs should be more subtle.
-    prompt = {
-        "role": "system",
-        "content": f"""You are a helpful assistant specializing in generating pairs of words, phrases, and/or sentences in two different languages. You will be given the two languages to use, the skill level and the list of categories to draw from.\n\nSkill level details:\n{levels}\n\nCategories:\n{', '.join(selected_categories)}\n\n"""
-    }
     user_message = {
         "role": "user",
         "content": (
+            f"Task: {'board, pairs first' if story_last else 'board'}\n"
             f"L1: {L1_language}\nL2: {L2_language}\n"
-            f"Skill Level: {reading_level.description()}\n"
+            f"Skill Level: {reading_level.value}\n"
             f"Categories: {', '.join(selected_categories)}\n"
-            f"Write a representative story and then generate {n} matching pairs, aligning with the requirements above, respecting the skill level and make sure that each pair translates properly between L1 and L2:\n"
+            f"Pairs: {n}\n"
         )
     }
+    return selected_categories, [system_prompt, user_message]
+
+def generate_language_pairs(L1_language: str, L2_language: str, n: int, reading_level: ReadingLevel, deadline: float | None = None, labels: dict | None = None) -> dict:
+    """Generate one board; phases are timed under `labels` when a request is waiting on it."""
+    with timed_phase("prompt_build", labels):
+        selected_categories, messages = build_messages(L1_language, L2_language, n, reading_level)
 
     # Call OpenAI API
-    response = client.beta.chat.completions.parse(
-        model="gpt-4o-2024-11-20",
-        messages=[prompt, user_message],
-        response_format=LanguagePairs
-    )
+    with timed_phase("upstream", labels):
+        start = time.perf_counter()
+        response = upstream_caller.call(lambda model, timeout: client.with_options(timeout=timeout, max_retries=0).chat.completions.create(
+            model=model,
+            messages=messages,
+            response_format=LANGUAGE_PAIRS_FORMAT
+        ), deadline=deadline)
+        usage_tracker.record("single", response.usage, time.perf_counter() - start)
 
-    parsed = response.choices[0].message.parsed.model_dump()
+    # Validated here rather than inside the SDK so pydantic parsing is timed on its own
+    with timed_phase("parse", labels):
+        parsed = LanguagePairs.model_validate_json(response.choices[0].message.content).model_dump()
+    corpus.add_board(L1_language, L2_language, reading_level.value, selected_categories, parsed)
     return parsed
 
+def build_batch_messages(L1_language: str, L2_language: str, n: int, reading_level: ReadingLevel, rounds: int) -> tuple[list[list[str]], list[dict]]:
+    # Each round draws its own categories so the rounds don't all look alike
+    round_categories = [random.sample(categories, 8) for _ in range(rounds)]
+
+    round_lines = "\n".join(f"Round {i + 1} categories: {', '.join(selected)}" for i, selected in enumerate(round_categories))
+    user_message = {
+        "role": "user",
+        "content": (
+            f"Task: rounds\n"
+            f"L1: {L1_language}\nL2: {L2_language}\n"
+            f"Skill Level: {reading_level.value}\n"
+            f"Rounds: {rounds}\n"
+            f"Pairs per round: {n}\n"
+            f"{round_lines}\n"
+        )
+    }
+    return round_categories, [system_prompt, user_message]
+
+def generate_language_pair_rounds(L1_language: str, L2_language: str, n: int, reading_level: ReadingLevel, rounds: int, deadline: float | None = None) -> list[dict]:
+    """Generate several independent boards with a single model call."""
+    round_categories, messages = build_batch_messages(L1_language, L2_language, n, reading_level, rounds)
+
+    start = time.perf_counter()
+    response = upstream_caller.call(lambda model, timeout: client.with_options(timeout=timeout, max_retries=0).beta.chat.completions.parse(
+        model=model,
+        messages=messages,
+        response_format=LanguagePairRounds
+    ), deadline=deadline)
+    usage_tracker.record("batch", response.usage, time.perf_counter() - start)
+
+    parsed = response.choices[0].message.parsed.model_dump()["rounds"][:rounds]
+    for selected_categories, board in zip(round_categories, parsed):
+        corpus.add_board(L1_language, L2_language, reading_level.value, selected_categories, board)
+    return parsed
+
+def stream_language_pairs(L1_language: str, L2_language: str, n: int, reading_level: ReadingLevel, deadline: float):
+    """Yield each pair as soon as the model has finished it, then the complete result.
+
+    Raises DeadlineExceeded if the model hasn't finished by `deadline`.
+    """
+    selected_categories, messages = build_messages(L1_language, L2_language, n, reading_level, story_last=True)
+
+    sent = 0
+    start = time.perf_counter()
+    first_token = None
+    try:
+        with client.with_options(timeout=upstream_caller.remaining(deadline), max_retries=0).beta.chat.completions.stream(
+            model=MODEL,
+            messages=messages,
+            response_format=StreamedLanguagePairs,
+            stream_options={"include_usage": True}
+        ) as stream:
+            for event in stream:
+                upstream_caller.remaining(deadline)
+                if event.type != "content.delta" or not event.parsed:
+                    continue
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                # The last pair in a partial snapshot may still be mid-string.
+                pairs = event.parsed.get("pairs") or []
+                while sent < len(pairs) - 1:
+                    yield {"pair": pairs[sent]}
+                    sent += 1
+
+            completion = stream.get_final_completion()
+    except APITimeoutError as e:
+        raise upstream_caller.deadline_exceeded() from e
+    usage_tracker.record("stream", completion.usage, time.perf_counter() - start, first_token)
+
+    parsed = completion.choices[0].message.parsed.model_dump()
+
+    for pair in parsed["pairs"][sent:]:
+        yield {"pair": pair}
+    corpus.add_board(L1_language, L2_language, reading_level.value, selected_categories, parsed)
+    yield {"done": True, **parsed}
+
+def build_replacement_messages(L1_language: str, L2_language: str, count: int, reading_level: ReadingLevel, exclude: list[dict]) -> tuple[list[str], list[dict]]:
+    selected_categories = random.sample(categories, 8)
+    existing = "\n".join(f"- {pair['L1']} / {pair['L2']}" for pair in exclude)
+    user_message = {
+        "role": "user",
+        "content": (
+            f"Task: replacement\n"
+            f"L1: {L1_language}\nL2: {L2_language}\n"
+            f"Skill Level: {reading_level.value}\n"
+            f"Categories: {', '.join(selected_categories)}\n"
+            f"Pairs: {count}\n"
+            f"Existing pairs:\n{existing}\n"
+        )
+    }
+    return selected_categories, [system_prompt, user_message]
+
+def generate_replacement_pairs(L1_language: str, L2_language: str, count: int, reading_level: ReadingLevel, exclude: list[dict], deadline: float | None = None) -> list[dict]:
+    """Ask the model for `count` pairs unlike any in `exclude`, without a story."""
+    selected_categories, messages = build_replacement_messages(L1_language, L2_language, count, reading_level, exclude)
+
+    start = time.perf_counter()
+    response = upstream_caller.call(lambda model, timeout: client.with_options(timeout=timeout, max_retries=0).beta.chat.completions.parse(
+        model=model,
+        messages=messages,
+        response_format=ReplacementPairs
+    ), deadline=deadline)
+    usage_tracker.record("replacement", response.usage, time.perf_counter() - start)
+
+    pairs = response.choices[0].message.parsed.model_dump()["pairs"][:count]
+    corpus.add_board(L1_language, L2_language, reading_level.value, selected_categories, {"representative_story": "", "pairs": pairs})
+    return pairs
+
+def replace_missing_pairs(key: tuple, kept: list[dict], seen: list[dict], n: int, L1_language: str, L2_language: str, reading_level: ReadingLevel, deadline: float | None = None) -> list[dict]:
+    threshold = DEDUP_THRESHOLDS[reading_level]
+    missing = n - len(kept)
+    if missing > 0:
+        # Stored pairs cost nothing, so only ask the model for what the corpus can't fill
+        candidates = corpus.candidates(L1_language, L2_language, reading_level.value, corpus.min_factor * missing)
+        fill = pair_filter.select(key, candidates, accepted=kept, threshold=threshold)[:missing]
+        corpus.mark_served(L1_language, L2_language, reading_level.value, fill)
+        kept = kept + fill
+    for _ in range(DEDUP_REPLACEMENT_ATTEMPTS):
+        missing = n - len(kept)
+        if missing <= 0:
+            break
+        exclude = seen + pair_filter.recent(key, DEDUP_RECENT_EXCLUDE)
+        replacements = generate_replacement_pairs(L1_language, L2_language, missing, reading_level, exclude, deadline)
+        seen = seen + replacements
+        kept = kept + pair_filter.select(key, replacements, accepted=kept, threshold=threshold)[:missing]
+    if len(kept) < n:
+        raise NotEnoughPairs(f"Only {len(kept)} of {n} pairs were distinct enough, try again")
+    return kept
+
+def filter_pairs(key: tuple, pairs: list[dict], n: int, L1_language: str, L2_language: str, reading_level: ReadingLevel, deadline: float | None = None) -> list[dict]:
+    """Drop near-duplicate and recently served pairs, asking the model only for the ones that are missing."""
+    kept = pair_filter.select(key, pairs, threshold=DEDUP_THRESHOLDS[reading_level])[:n]
+    kept = replace_missing_pairs(key, kept, pairs, n, L1_language, L2_language, reading_level, deadline)
+    pair_filter.remember(key, kept)
+    return kept
+
+def filter_stream(key: tuple, messages, n: int, L1_language: str, L2_language: str, reading_level: ReadingLevel, deadline: float | None = None):
+    """Apply filter_pairs to a stream of messages, checking each pair as it arrives."""
+    sent, seen = [], []
+    for message in messages:
+        if "pair" in message:
+            seen.append(message["pair"])
+            if pair_filter.select(key, [message["pair"]], accepted=sent, threshold=DEDUP_THRESHOLDS[reading_level]):
+                sent.append(message["pair"])
+                yield message
+        elif message.get("done"):
+            kept = replace_missing_pairs(key, sent, seen, n, L1_language, L2_language, reading_level, deadline)
+            for pair in kept[len(sent):]:
+                yield {"pair": pair}
+            pair_filter.remember(key, kept)
+            yield {**message, "pairs": kept}
+        else:
+            yield message
+
+def filter_key(data: dict, L1_language: str, L2_language: str, reading_level: ReadingLevel) -> tuple | None:
+    # Recent pairs are only tracked per session; without one, boards are just deduplicated internally
+    if not data.get("session_id"):
+        return None
+    return (data["session_id"], L1_language, L2_language, reading_level.value)
+
+# Pool of ready boards so /generate doesn't have to wait on the model
+pair_pool = PairPool(
+    generate_language_pairs,
+    low_water=int(os.environ.get("POOL_LOW_WATER", 2)),
+    max_per_key=int(os.environ.get("POOL_MAX_PER_KEY", 4)),
+    max_keys=int(os.environ.get("POOL_MAX_KEYS", 32)),
+)
+
 @app.route("/")
 def index():
     return render_template("index.html")
 
 @app.route("/generate", methods=["POST"])
 def generate():
-    data = request.json
+    start = time.perf_counter()
+    # One deadline for every model call this request makes
+    deadline = upstream_caller.new_deadline()
+    labels = {"level": "unknown", "languages": "unknown", "n": "unknown"}
+    status = 200
+    try:
+        with profiler.profile("generate", force=request.headers.get("X-Profile") == "1"):
+            data = request.json
+            L1_language = data["L1_language"]
+            L2_language = data["L2_language"]
+            n = int(data["n"])
+            if n < 1:
+                raise ValueError("n must be at least 1")
+            reading_level = ReadingLevel[data["reading_level"]]
+            labels = generation_labels(L1_language, L2_language, n, reading_level)
+            metrics.observe("matching_generate_phase_seconds", {**labels, "phase": "validation"}, time.perf_counter() - start)
+
+            with timed_phase("corpus", labels):
+                result = corpus.assemble(L1_language, L2_language, reading_level.value, n)
+            if result is None:
+                with timed_phase("pool", labels):
+                    result = pair_pool.get((L1_language, L2_language, n, reading_level), deadline=deadline, labels=labels)
+            with timed_phase("dedup", labels):
+                key = filter_key(data, L1_language, L2_language, reading_level)
+                result = {**result, "pairs": filter_pairs(key, result["pairs"], n, L1_language, L2_language, reading_level, deadline)}
+            with timed_phase("jsonify", labels):
+                return jsonify(result)
+    except DeadlineExceeded as e:
+        status = 504
+        metrics.inc("matching_generate_errors_total", {**labels, "exception": type(e).__name__})
+        return jsonify({"error": str(e)}), 504
+    except NotEnoughPairs as e:
+        status = 503
+        metrics.inc("matching_generate_errors_total", {**labels, "exception": type(e).__name__})
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        status = 400
+        metrics.inc("matching_generate_errors_total", {**labels, "exception": type(e).__name__})
+        return jsonify({"error": str(e)}), 400
+    finally:
+        metrics.inc("matching_generate_requests_total", {**labels, "status": str(status)})
+        metrics.observe("matching_generate_request_seconds", labels, time.perf_counter() - start)
+
+@app.route("/generate/batch", methods=["POST"])
+def generate_batch():
+    deadline = upstream_caller.new_deadline()
     try:
+        data = request.json
         L1_language = data["L1_language"]
         L2_language = data["L2_language"]
         n = int(data["n"])
+        if n < 1:
+            raise ValueError("n must be at least 1")
         reading_level = ReadingLevel[data["reading_level"]]
+        rounds = min(max(int(data.get("rounds", 1)), 1), MAX_BATCH_ROUNDS)
+
+        # Serve what the corpus can and make one model call for the rest
+        results = []
+        for _ in range(rounds):
+            result = corpus.assemble(L1_language, L2_language, reading_level.value, n)
+            if result is None:
+                break
+            results.append(result)
+        if len(results) < rounds:
+            results += generate_language_pair_rounds(L1_language, L2_language, n, reading_level, rounds - len(results), deadline)
+
+        # Rounds are filtered in order, so within a session later rounds also avoid the earlier ones
+        key = filter_key(data, L1_language, L2_language, reading_level)
+        results = [{**result, "pairs": filter_pairs(key, result["pairs"], n, L1_language, L2_language, reading_level, deadline)} for result in results]
+        return jsonify({"rounds": results})
+    except DeadlineExceeded as e:
+        return jsonify({"error": str(e)}), 504
+    except NotEnoughPairs as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
 
-        result = generate_language_pairs(L1_language, L2_language, n, reading_level)
-        return jsonify(result)
+# Newline-delimited JSON: {"pair": ...} per pair, then {"done": true, ...full result}
+@app.route("/generate/stream", methods=["POST"])
+def generate_stream():
+    deadline = upstream_caller.new_deadline()
+    try:
+        data = request.json
+        L1_language = data["L1_language"]
+        L2_language = data["L2_language"]
+        n = int(data["n"])
+        if n < 1:
+            raise ValueError("n must be at least 1")
+        reading_level = ReadingLevel[data["reading_level"]]
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
+    def events():
+        try:
+            result = corpus.assemble(L1_language, L2_language, reading_level.value, n)
+            if result is not None:
+                messages = [{"pair": pair} for pair in result["pairs"]] + [{"done": True, **result}]
+            else:
+                messages = stream_language_pairs(L1_language, L2_language, n, reading_level, deadline)
+            key = filter_key(data, L1_language, L2_language, reading_level)
+            for message in filter_stream(key, messages, n, L1_language, L2_language, reading_level, deadline):
+                yield json.dumps(message) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+
+    return Response(events(), mimetype="application/x-ndjson")
+
+@app.route("/pool/stats")
+def pool_stats():
+    return jsonify(pair_pool.stats())
+
+@app.route("/corpus/stats")
+def corpus_stats():
+    return jsonify(corpus.stats())
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/upstream/stats")
+def upstream_stats():
+    return jsonify(upstream_caller.stats())
+
+@app.route("/usage/stats")
+def usage_stats():
+    return jsonify(usage_tracker.stats())
+
+@app.cli.command("warm")
+@click.option("--pairs", "language_pairs", multiple=True, required=True, help="Language pair as L1:L2, e.g. English:Spanish. Repeatable.")
+@click.option("--levels", default=",".join(level.value for level in ReadingLevel), help="Comma separated reading levels.")
+@click.option("--boards", default=3, help="Boards to generate per language pair and level.")
+@click.option("--n", default=10, help="Pairs per generated board.")
+def warm(language_pairs, levels, boards, n):
+    """Fill the corpus ahead of time for the given language pairs and levels."""
+    for language_pair in language_pairs:
+        L1_language, L2_language = language_pair.split(":", 1)
+        for level in levels.split(","):
+            reading_level = ReadingLevel[level.strip()]
+            for _ in range(boards):
+                try:
+                    generate_language_pairs(L1_language, L2_language, n, reading_level)
+                except Exception as e:
+                    click.echo(f"{L1_language}:{L2_language} {reading_level.value}: {e}", err=True)
+            click.echo(f"Warmed {L1_language}:{L2_language} {reading_level.value}")
+
+@app.cli.command("corpus-export")
+@click.argument("path", type=click.File("w", encoding="utf-8"))
+def corpus_export(path):
+    """Export the corpus as JSON lines, one board per line."""
+    click.echo(f"Exported {corpus.export_jsonl(path)} boards")
+
+@app.cli.command("corpus-import")
+@click.argument("path", type=click.File("r", encoding="utf-8"))
+def corpus_import(path):
+    """Import boards from a JSON lines file written by corpus-export."""
+    click.echo(f"Imported {corpus.import_jsonl(path)} boards")
+
 if __name__ == "__main__":
     app.run(debug=True)
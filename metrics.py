@@ -0,0 +1,125 @@
+from contextlib import contextmanager
+import cProfile
+import os
+import random
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+
+class Metrics:
+    """Minimal counter and histogram registry rendered in the Prometheus text format."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = {}
+        self._histograms = {}
+
+    def describe(self, name, kind, help_text):
+        self._help[name] = (kind, help_text)
+
+    def inc(self, name, labels, amount=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    @contextmanager
+    def time(self, name, labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, labels, time.perf_counter() - start)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            names = sorted({name for name, _ in self._counters} | {name for name, _ in self._histograms})
+            for name in names:
+                if name in self._help:
+                    kind, help_text = self._help[name]
+                    lines.append(f"# HELP {name} {help_text}")
+                    lines.append(f"# TYPE {name} {kind}")
+                for (metric, labels), value in sorted(self._counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{format_labels(labels)} {value}")
+                for (metric, labels), histogram in sorted(self._histograms.items()):
+                    if metric != name:
+                        continue
+                    for bound, count in zip(self.buckets, histogram["buckets"]):
+                        lines.append(f"{name}_bucket{format_labels(labels + (('le', repr(bound)),))} {count}")
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {histogram['count']}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {histogram['sum']}")
+                    lines.append(f"{name}_count{format_labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label_value(value)}"' for key, value in labels) + "}"
+
+
+def escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class RequestProfiler:
+    """Runs sampled or explicitly requested requests under cProfile and keeps the slow ones.
+
+    A request is profiled when `force` is set (e.g. from a request header) or
+    with probability `sample_rate`. Its stats are dumped to `directory` if it
+    was forced or took longer than `slow_seconds`. Only one request is profiled
+    at a time; others that would be profiled meanwhile run unprofiled.
+    """
+
+    def __init__(self, directory, sample_rate=0.0, slow_seconds=5.0):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+        # cProfile can't have two profilers enabled at once (a ValueError on Python 3.12+)
+        self._active = threading.Lock()
+
+    @contextmanager
+    def profile(self, name, force=False):
+        if not force and random.random() >= self.sample_rate:
+            yield
+            return
+        if not self._active.acquire(blocking=False):
+            yield
+            return
+
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another tool's profiler is already running
+                yield
+                return
+            try:
+                yield
+            finally:
+                profiler.disable()
+                elapsed = time.perf_counter() - start
+                if force or elapsed >= self.slow_seconds:
+                    os.makedirs(self.directory, exist_ok=True)
+                    profiler.dump_stats(os.path.join(self.directory, f"{name}-{time.time():.3f}-{elapsed:.3f}s.prof"))
+        finally:
+            self._active.release()
@@ -0,0 +1,107 @@
+from collections import OrderedDict, deque
+import threading
+
+
+class PairPool:
+    """Pool of pre-generated boards keyed by (L1, L2, reading level, n).
+
+    A background worker keeps every key that has been requested topped up to
+    `low_water` ready results. Keys that go cold are evicted least recently
+    used first once more than `max_keys` are tracked. The worker thread only
+    starts once the first key is scheduled, so an unused pool costs nothing.
+    """
+
+    def __init__(self, generate, low_water=2, max_per_key=4, max_keys=32):
+        self.generate = generate
+        self.low_water = low_water
+        self.max_per_key = max(max_per_key, low_water)
+        self.max_keys = max_keys
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.refill_errors = 0
+
+        self._entries = OrderedDict()
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._worker = None
+
+    def get(self, key, **kwargs):
+        """Pop a ready result for `key`, or generate one inline on a miss.
+
+        `kwargs` are passed to the inline call only (e.g. the request's
+        deadline); background refills get none.
+        """
+        result = self.take(key)
+        if result is None:
+            result = self.generate(*key, **kwargs)
+        return result
+
+    def take(self, key):
+        """Pop a ready result for `key` without blocking, or return None on a miss. Either way `key` gets topped up."""
+        with self._lock:
+            ready = self._touch(key)
+            result = ready.popleft() if ready else None
+            if result is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self._schedule(key)
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "refill_errors": self.refill_errors,
+                "keys": len(self._entries),
+                "ready": sum(len(ready) for ready in self._entries.values()),
+            }
+
+    # The helpers below expect self._lock to be held.
+    def _touch(self, key):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+        self._entries[key] = deque()
+        while len(self._entries) > self.max_keys:
+            cold_key, _ = self._entries.popitem(last=False)
+            self.evictions += 1
+            if cold_key in self._pending:
+                self._pending.remove(cold_key)
+        return self._entries[key]
+
+    def _schedule(self, key):
+        if key not in self._pending and len(self._entries[key]) < self.low_water:
+            self._pending.append(key)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="pair-pool-refill", daemon=True)
+                self._worker.start()
+            self._wakeup.notify()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._pending:
+                    self._wakeup.wait()
+                key = self._pending.popleft()
+
+            try:
+                result = self.generate(*key)
+            except Exception:
+                with self._lock:
+                    self.refill_errors += 1
+                continue
+
+            with self._lock:
+                # The key may have been evicted while we were generating.
+                ready = self._entries.get(key)
+                if ready is None:
+                    continue
+                if len(ready) < self.max_per_key:
+                    ready.append(result)
+                self._schedule(key)
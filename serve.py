@@ -0,0 +1,454 @@
+"""Async serving mode for production.
+
+Run with an ASGI server, e.g. `hypercorn serve:app`. Upstream model calls go
+through one shared AsyncOpenAI client, are capped at SERVE_MAX_IN_FLIGHT at a
+time with at most SERVE_MAX_WAITING queued behind them, and identical
+concurrent /generate requests share a single upstream call. Ready boards come
+from a PairPool, as in main.py, whose refills also run on the server's event
+loop behind the same limiter.
+"""
+from contextlib import asynccontextmanager
+from openai import APITimeoutError, AsyncOpenAI
+from quart import Quart, Response, render_template, request, jsonify
+from main import (
+    DEDUP_RECENT_EXCLUDE, DEDUP_REPLACEMENT_ATTEMPTS, DEDUP_THRESHOLDS, LANGUAGE_PAIRS_FORMAT, LanguagePairRounds, LanguagePairs, MAX_BATCH_ROUNDS, MODEL, ReadingLevel, ReplacementPairs,
+    StreamedLanguagePairs,
+    build_batch_messages, build_messages, build_replacement_messages, corpus, filter_key, generation_labels, metrics,
+    pair_filter, timed_phase, upstream_caller, usage_tracker,
+)
+from dedup import NotEnoughPairs
+from pool import PairPool
+from upstream import DeadlineExceeded
+import asyncio
+import json
+import os
+import time
+
+app = Quart(__name__)
+
+async_client = AsyncOpenAI()
+
+RETRY_AFTER = int(os.environ.get("SERVE_RETRY_AFTER", 2))
+
+
+class Overloaded(Exception):
+    pass
+
+
+class UpstreamLimiter:
+    """Caps in-flight upstream calls and rejects new ones once the wait queue is full."""
+
+    def __init__(self, max_in_flight, max_waiting):
+        self.max_waiting = max_waiting
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+
+    async def try_reserve(self):
+        """Take a free slot without waiting, or return None if there isn't one (e.g. for a hedge)."""
+        if self._semaphore.locked():
+            return None
+        # Doesn't suspend: the semaphore has a free slot and nobody is queued for it
+        await self._semaphore.acquire()
+        return SlotReservation(self._semaphore)
+
+    async def reserve(self):
+        """Wait for a slot and return a reservation whose release() is safe to call more than once."""
+        if self._semaphore.locked() and self.waiting >= self.max_waiting:
+            raise Overloaded("Too many pending generations, try again shortly")
+
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        return SlotReservation(self._semaphore)
+
+    @asynccontextmanager
+    async def slot(self):
+        reservation = await self.reserve()
+        try:
+            yield
+        finally:
+            reservation.release()
+
+
+class SlotReservation:
+    def __init__(self, semaphore):
+        self._semaphore = semaphore
+        self._held = True
+
+    def release(self):
+        if self._held:
+            self._held = False
+            self._semaphore.release()
+
+
+limiter = UpstreamLimiter(
+    max_in_flight=int(os.environ.get("SERVE_MAX_IN_FLIGHT", 8)),
+    max_waiting=int(os.environ.get("SERVE_MAX_WAITING", 32)),
+)
+
+# (L1, L2, reading level, n) -> the upstream call every identical request is waiting on, and the dedup keys of its waiters
+in_flight: dict[tuple, tuple[asyncio.Task, set]] = {}
+
+
+async def generate_language_pairs(L1_language: str, L2_language: str, n: int, reading_level: ReadingLevel, deadline: float | None = None, labels: dict | None = None) -> dict:
+    with timed_phase("prompt_build", labels):
+        selected_categories, messages = build_messages(L1_language, L2_language, n, reading_level)
+
+    async with limiter.slot():
+        with timed_phase("upstream", labels):
+            start = time.perf_counter()
+            response = await upstream_caller.acall(lambda model, timeout: async_client.with_options(timeout=timeout, max_retries=0).chat.completions.create(
+                model=model,
+                messages=messages,
+                response_format=LANGUAGE_PAIRS_FORMAT
+            ), deadline=deadline, hedge_slot=limiter.try_reserve)
+            usage_tracker.record("single", response.usage, time.perf_counter() - start)
+
+    with timed_phase("parse", labels):
+        parsed = LanguagePairs.model_validate_json(response.choices[0].message.content).model_dump()
+    await asyncio.to_thread(corpus.add_board, L1_language, L2_language, reading_level.value, selected_categories, parsed)
+    return parsed
+
+
+async def generate_language_pair_rounds(L1_language: str, L2_language: str, n: int, reading_level: ReadingLevel, rounds: int, deadline: float | None = None) -> list[dict]:
+    round_categories, messages = build_batch_messages(L1_language, L2_language, n, reading_level, rounds)
+
+    async with limiter.slot():
+        start = time.perf_counter()
+        response = await upstream_caller.acall(lambda model, timeout: async_client.with_options(timeout=timeout, max_retries=0).beta.chat.completions.parse(
+            model=model,
+            messages=messages,
+            response_format=LanguagePairRounds
+        ), deadline=deadline, hedge_slot=limiter.try_reserve)
+        usage_tracker.record("batch", response.usage, time.perf_counter() - start)
+
+    parsed = response.choices[0].message.parsed.model_dump()["rounds"][:rounds]
+    for selected_categories, board in zip(round_categories, parsed):
+        await asyncio.to_thread(corpus.add_board, L1_language, L2_language, reading_level.value, selected_categories, board)
+    return parsed
+
+
+# Set once the server is running, so the pool's refill thread can schedule generations on it
+serving_loop: asyncio.AbstractEventLoop | None = None
+
+
+@app.before_serving
+async def remember_serving_loop():
+    global serving_loop
+    serving_loop = asyncio.get_running_loop()
+
+
+def refill_language_pairs(*key) -> dict:
+    # Runs on the pool's refill thread; the generation itself waits for a limiter slot like any request
+    return asyncio.run_coroutine_threadsafe(generate_language_pairs(*key), serving_loop).result()
+
+
+# Pool of ready boards so /generate doesn't have to wait on the model
+pair_pool = PairPool(
+    refill_language_pairs,
+    low_water=int(os.environ.get("POOL_LOW_WATER", 2)),
+    max_per_key=int(os.environ.get("POOL_MAX_PER_KEY", 4)),
+    max_keys=int(os.environ.get("POOL_MAX_KEYS", 32)),
+)
+
+
+async def coalesced_generate(key: tuple, deadline: float, labels: dict, session: tuple | None = None) -> tuple[dict, bool]:
+    """Return the board for `key` and whether a request with the same dedup key `session` is already waiting on it."""
+    if key in in_flight:
+        task, sessions = in_flight[key]
+    else:
+        task, sessions = asyncio.create_task(generate_language_pairs(*key, deadline, labels)), set()
+        in_flight[key] = (task, sessions)
+        task.add_done_callback(lambda _: in_flight.pop(key, None))
+    repeated = session is not None and session in sessions
+    if session is not None:
+        sessions.add(session)
+    # The call runs to the first waiter's deadline; later waiters still give up at their own.
+    # Shielded so one waiter disconnecting or timing out doesn't cancel the call for the rest.
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), upstream_caller.remaining(deadline)), repeated
+    except asyncio.TimeoutError:
+        # Not counted in the upstream stats; the call itself may still finish for other waiters.
+        raise DeadlineExceeded(f"Upstream did not answer within {upstream_caller.deadline:g}s") from None
+
+
+async def stream_language_pairs(L1_language: str, L2_language: str, n: int, reading_level: ReadingLevel, reservation: SlotReservation, deadline: float):
+    """Stream a board using a limiter slot the caller already reserved; the slot is freed once the model is done.
+
+    Raises DeadlineExceeded if the model hasn't finished by `deadline`.
+    """
+    selected_categories, messages = build_messages(L1_language, L2_language, n, reading_level, story_last=True)
+
+    sent = 0
+    try:
+        start = time.perf_counter()
+        first_token = None
+        async with async_client.with_options(timeout=upstream_caller.remaining(deadline), max_retries=0).beta.chat.completions.stream(
+            model=MODEL,
+            messages=messages,
+            response_format=StreamedLanguagePairs,
+            stream_options={"include_usage": True}
+        ) as stream:
+            async for event in stream:
+                upstream_caller.remaining(deadline)
+                if event.type != "content.delta" or not event.parsed:
+                    continue
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                # The last pair in a partial snapshot may still be mid-string.
+                pairs = event.parsed.get("pairs") or []
+                while sent < len(pairs) - 1:
+                    yield {"pair": pairs[sent]}
+                    sent += 1
+
+            completion = await stream.get_final_completion()
+        usage_tracker.record("stream", completion.usage, time.perf_counter() - start, first_token)
+    except APITimeoutError as e:
+        raise upstream_caller.deadline_exceeded() from e
+    finally:
+        reservation.release()
+
+    parsed = completion.choices[0].message.parsed.model_dump()
+
+    for pair in parsed["pairs"][sent:]:
+        yield {"pair": pair}
+    await asyncio.to_thread(corpus.add_board, L1_language, L2_language, reading_level.value, selected_categories, parsed)
+    yield {"done": True, **parsed}
+
+
+async def generate_replacement_pairs(L1_language: str, L2_language: str, count: int, reading_level: ReadingLevel, exclude: list[dict], deadline: float | None = None) -> list[dict]:
+    selected_categories, messages = build_replacement_messages(L1_language, L2_language, count, reading_level, exclude)
+
+    async with limiter.slot():
+        start = time.perf_counter()
+        response = await upstream_caller.acall(lambda model, timeout: async_client.with_options(timeout=timeout, max_retries=0).beta.chat.completions.parse(
+            model=model,
+            messages=messages,
+            response_format=ReplacementPairs
+        ), deadline=deadline, hedge_slot=limiter.try_reserve)
+        usage_tracker.record("replacement", response.usage, time.perf_counter() - start)
+
+    pairs = response.choices[0].message.parsed.model_dump()["pairs"][:count]
+    await asyncio.to_thread(corpus.add_board, L1_language, L2_language, reading_level.value, selected_categories, {"representative_story": "", "pairs": pairs})
+    return pairs
+
+
+async def replace_missing_pairs(key: tuple, kept: list[dict], seen: list[dict], n: int, L1_language: str, L2_language: str, reading_level: ReadingLevel, deadline: float | None = None) -> list[dict]:
+    threshold = DEDUP_THRESHOLDS[reading_level]
+    missing = n - len(kept)
+    if missing > 0:
+        candidates = await asyncio.to_thread(corpus.candidates, L1_language, L2_language, reading_level.value, corpus.min_factor * missing)
+        fill = pair_filter.select(key, candidates, accepted=kept, threshold=threshold)[:missing]
+        await asyncio.to_thread(corpus.mark_served, L1_language, L2_language, reading_level.value, fill)
+        kept = kept + fill
+    for _ in range(DEDUP_REPLACEMENT_ATTEMPTS):
+        missing = n - len(kept)
+        if missing <= 0:
+            break
+        exclude = seen + pair_filter.recent(key, DEDUP_RECENT_EXCLUDE)
+        replacements = await generate_replacement_pairs(L1_language, L2_language, missing, reading_level, exclude, deadline)
+        seen = seen + replacements
+        kept = kept + pair_filter.select(key, replacements, accepted=kept, threshold=threshold)[:missing]
+    if len(kept) < n:
+        raise NotEnoughPairs(f"Only {len(kept)} of {n} pairs were distinct enough, try again")
+    return kept
+
+
+async def filter_pairs(key: tuple, pairs: list[dict], n: int, L1_language: str, L2_language: str, reading_level: ReadingLevel, deadline: float | None = None) -> list[dict]:
+    kept = pair_filter.select(key, pairs, threshold=DEDUP_THRESHOLDS[reading_level])[:n]
+    kept = await replace_missing_pairs(key, kept, pairs, n, L1_language, L2_language, reading_level, deadline)
+    pair_filter.remember(key, kept)
+    return kept
+
+
+async def filter_stream(key: tuple, messages, n: int, L1_language: str, L2_language: str, reading_level: ReadingLevel, deadline: float | None = None):
+    sent, seen = [], []
+    async for message in messages:
+        if "pair" in message:
+            seen.append(message["pair"])
+            if pair_filter.select(key, [message["pair"]], accepted=sent, threshold=DEDUP_THRESHOLDS[reading_level]):
+                sent.append(message["pair"])
+                yield message
+        elif message.get("done"):
+            kept = await replace_missing_pairs(key, sent, seen, n, L1_language, L2_language, reading_level, deadline)
+            for pair in kept[len(sent):]:
+                yield {"pair": pair}
+            pair_filter.remember(key, kept)
+            yield {**message, "pairs": kept}
+        else:
+            yield message
+
+
+async def board_messages(result):
+    for pair in result["pairs"]:
+        yield {"pair": pair}
+    yield {"done": True, **result}
+
+
+def parse_request(data):
+    if not isinstance(data, dict):
+        raise ValueError("Request body must be a JSON object")
+    n = int(data["n"])
+    if n < 1:
+        raise ValueError("n must be at least 1")
+    return (
+        data["L1_language"],
+        data["L2_language"],
+        n,
+        ReadingLevel[data["reading_level"]],
+    )
+
+
+def overloaded(e):
+    return jsonify({"error": str(e)}), 429, {"Retry-After": str(RETRY_AFTER)}
+
+
+@app.route("/")
+async def index():
+    return await render_template("index.html")
+
+
+@app.route("/pool/stats")
+async def pool_stats():
+    return jsonify(pair_pool.stats())
+
+
+@app.route("/corpus/stats")
+async def corpus_stats():
+    return jsonify(await asyncio.to_thread(corpus.stats))
+
+
+@app.route("/upstream/stats")
+async def upstream_stats():
+    return jsonify(upstream_caller.stats())
+
+
+@app.route("/usage/stats")
+async def usage_stats():
+    return jsonify(usage_tracker.stats())
+
+
+@app.route("/metrics")
+async def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/generate", methods=["POST"])
+async def generate():
+    start = time.perf_counter()
+    deadline = upstream_caller.new_deadline()
+    labels = {"level": "unknown", "languages": "unknown", "n": "unknown"}
+    status = 200
+    try:
+        data = await request.get_json()
+        L1_language, L2_language, n, reading_level = parse_request(data)
+        labels = generation_labels(L1_language, L2_language, n, reading_level)
+        metrics.observe("matching_generate_phase_seconds", {**labels, "phase": "validation"}, time.perf_counter() - start)
+
+        with timed_phase("corpus", labels):
+            result = await asyncio.to_thread(corpus.assemble, L1_language, L2_language, reading_level.value, n)
+        if result is None:
+            with timed_phase("pool", labels):
+                result = pair_pool.take((L1_language, L2_language, n, reading_level))
+        key = filter_key(data, L1_language, L2_language, reading_level)
+        if result is None:
+            with timed_phase("coalesced_wait", labels):
+                result, repeated = await coalesced_generate((L1_language, L2_language, n, reading_level), deadline, labels, key)
+            if repeated:
+                # The same session's earlier request already put this board in its window, so only dedup it internally
+                key = None
+        with timed_phase("dedup", labels):
+            result = {**result, "pairs": await filter_pairs(key, result["pairs"], n, L1_language, L2_language, reading_level, deadline)}
+        with timed_phase("jsonify", labels):
+            return jsonify(result)
+    except Overloaded as e:
+        status = 429
+        metrics.inc("matching_generate_errors_total", {**labels, "exception": type(e).__name__})
+        return overloaded(e)
+    except DeadlineExceeded as e:
+        status = 504
+        metrics.inc("matching_generate_errors_total", {**labels, "exception": type(e).__name__})
+        return jsonify({"error": str(e)}), 504
+    except NotEnoughPairs as e:
+        status = 503
+        metrics.inc("matching_generate_errors_total", {**labels, "exception": type(e).__name__})
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        status = 400
+        metrics.inc("matching_generate_errors_total", {**labels, "exception": type(e).__name__})
+        return jsonify({"error": str(e)}), 400
+    finally:
+        metrics.inc("matching_generate_requests_total", {**labels, "status": str(status)})
+        metrics.observe("matching_generate_request_seconds", labels, time.perf_counter() - start)
+
+
+@app.route("/generate/batch", methods=["POST"])
+async def generate_batch():
+    deadline = upstream_caller.new_deadline()
+    try:
+        data = await request.get_json()
+        L1_language, L2_language, n, reading_level = parse_request(data)
+        rounds = min(max(int(data.get("rounds", 1)), 1), MAX_BATCH_ROUNDS)
+
+        results = []
+        for _ in range(rounds):
+            result = await asyncio.to_thread(corpus.assemble, L1_language, L2_language, reading_level.value, n)
+            if result is None:
+                break
+            results.append(result)
+        if len(results) < rounds:
+            results += await generate_language_pair_rounds(L1_language, L2_language, n, reading_level, rounds - len(results), deadline)
+
+        key = filter_key(data, L1_language, L2_language, reading_level)
+        results = [{**result, "pairs": await filter_pairs(key, result["pairs"], n, L1_language, L2_language, reading_level, deadline)} for result in results]
+        return jsonify({"rounds": results})
+    except Overloaded as e:
+        return overloaded(e)
+    except DeadlineExceeded as e:
+        return jsonify({"error": str(e)}), 504
+    except NotEnoughPairs as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/generate/stream", methods=["POST"])
+async def generate_stream():
+    deadline = upstream_caller.new_deadline()
+    try:
+        data = await request.get_json()
+        L1_language, L2_language, n, reading_level = parse_request(data)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+    result = await asyncio.to_thread(corpus.assemble, L1_language, L2_language, reading_level.value, n)
+    # Take the slot before answering so an overload is a 429, not an error line inside a 200 stream.
+    reservation = None
+    if result is None:
+        try:
+            reservation = await limiter.reserve()
+        except Overloaded as e:
+            return overloaded(e)
+
+    async def events():
+        try:
+            if result is not None:
+                messages = board_messages(result)
+            else:
+                messages = stream_language_pairs(L1_language, L2_language, n, reading_level, reservation, deadline)
+            key = filter_key(data, L1_language, L2_language, reading_level)
+            async for message in filter_stream(key, messages, n, L1_language, L2_language, reading_level, deadline):
+                yield json.dumps(message) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+        finally:
+            if reservation is not None:
+                reservation.release()
+
+    return Response(events(), mimetype="application/x-ndjson")
+
+
+if __name__ == "__main__":
+    app.run()
@@ -1,3 +1,10 @@
+// Rounds fetched ahead of time for the current settings while auto-refresh is on
+const PREFETCH_DEPTH = 2;
+const prefetch = { key: null, rounds: [], pending: false };
+
+// Identifies this tab so the server can avoid repeating pairs it served here recently
+const SESSION_ID = getSessionId();
+
 document.getElementById("language-pair-form").addEventListener("submit", async function (e) {
     e.preventDefault();
 
@@ -5,14 +12,28 @@ document.getElementById("language-pair-form").addEventListener("submit", async f
     const L2_language = document.getElementById("L2_language").value;
     const n = document.getElementById("n").value;
     const reading_level = document.getElementById("reading_level").value;
+    const prefetched = takePrefetchedRound(settingsKey(L1_language, L2_language, n, reading_level));
 
     try {
-        const result = await fetchLanguagePairs(L1_language, L2_language, n, reading_level);
-        if (result) initializeGame(result.pairs, L1_language, L2_language);
+        if (prefetched) {
+            initializeGame(prefetched.pairs, L1_language, L2_language);
+        } else if (window.ReadableStream && window.TextDecoder) {
+            // Show pairs as they arrive instead of waiting for the whole board
+            const game = startGame(L1_language, L2_language);
+            await streamLanguagePairs(L1_language, L2_language, n, reading_level, pair => game.addPair(pair));
+            game.finish();
+        } else {
+            const result = await fetchLanguagePairs(L1_language, L2_language, n, reading_level);
+            if (result) initializeGame(result.pairs, L1_language, L2_language);
+        }
     } catch (err) {
         console.error("Error fetching language pairs:", err);
         displayError("Failed to load language pairs. Please try again.");
     }
+
+    if (document.getElementById("auto-refresh").checked) {
+        refillPrefetchQueue(L1_language, L2_language, n, reading_level);
+    }
 });
 
 /**
@@ -22,7 +43,7 @@ async function fetchLanguagePairs(L1, L2, n, level) {
     const response = await fetch("/generate", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ L1_language: L1, L2_language: L2, n, reading_level: level }),
+        body: JSON.stringify({ L1_language: L1, L2_language: L2, n, reading_level: level, session_id: SESSION_ID }),
     });
 
     if (!response.ok) {
@@ -33,41 +54,155 @@ async function fetchLanguagePairs(L1, L2, n, level) {
 }
 
 /**
- * Initialize the game board with buttons and timer.
+ * Fetch several independent rounds of language pairs in one request.
+ */
+async function fetchLanguagePairRounds(L1, L2, n, level, rounds) {
+    const response = await fetch("/generate/batch", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ L1_language: L1, L2_language: L2, n, reading_level: level, rounds, session_id: SESSION_ID }),
+    });
+
+    if (!response.ok) {
+        throw new Error("Error fetching language pair rounds");
+    }
+
+    return await response.json();
+}
+
+/**
+ * Get this tab's session id, creating one on first use.
+ */
+function getSessionId() {
+    let sessionId = sessionStorage.getItem("matching-game-session");
+    if (!sessionId) {
+        sessionId = window.crypto && crypto.randomUUID ? crypto.randomUUID() : Math.random().toString(36).slice(2);
+        sessionStorage.setItem("matching-game-session", sessionId);
+    }
+    return sessionId;
+}
+
+/**
+ * Identify a combination of game settings.
+ */
+function settingsKey(L1, L2, n, level) {
+    return JSON.stringify([L1, L2, n, level]);
+}
+
+/**
+ * Take the next prefetched round for these settings, dropping the queue if the settings changed.
+ */
+function takePrefetchedRound(key) {
+    if (prefetch.key !== key) {
+        prefetch.key = key;
+        prefetch.rounds = [];
+        return null;
+    }
+    return prefetch.rounds.shift() || null;
+}
+
+/**
+ * Top the prefetch queue back up in the background while the current round is played.
+ */
+async function refillPrefetchQueue(L1, L2, n, level) {
+    const key = settingsKey(L1, L2, n, level);
+    const missing = PREFETCH_DEPTH - prefetch.rounds.length;
+    if (prefetch.key !== key || prefetch.pending || missing <= 0) return;
+
+    prefetch.pending = true;
+    try {
+        const result = await fetchLanguagePairRounds(L1, L2, n, level, missing);
+        // Settings may have changed while the request was in flight
+        if (prefetch.key === key) prefetch.rounds.push(...result.rounds);
+    } catch (err) {
+        console.error("Error prefetching language pairs:", err);
+    } finally {
+        prefetch.pending = false;
+    }
+}
+
+/**
+ * Stream language pairs from the backend, calling onPair for each one as it arrives.
+ */
+async function streamLanguagePairs(L1, L2, n, level, onPair) {
+    const response = await fetch("/generate/stream", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ L1_language: L1, L2_language: L2, n, reading_level: level, session_id: SESSION_ID }),
+    });
+
+    if (!response.ok) {
+        throw new Error("Error fetching language pairs");
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffered = "";
+    let result = null;
+
+    const handleLine = line => {
+        if (!line.trim()) return;
+        const message = JSON.parse(line);
+        if (message.error) throw new Error(message.error);
+        if (message.pair) onPair(message.pair);
+        if (message.done) result = message;
+    };
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffered += decoder.decode(value, { stream: true });
+        const lines = buffered.split("\n");
+        buffered = lines.pop();
+        lines.forEach(handleLine);
+    }
+    handleLine(buffered + decoder.decode());
+
+    return result;
+}
+
+/**
+ * Initialize the game board with a complete set of pairs.
  */
 function initializeGame(pairs, L1_language, L2_language) {
+    const game = startGame(L1_language, L2_language);
+    pairs.forEach(pair => game.addPair(pair));
+    game.finish();
+}
+
+/**
+ * Render an empty game board and timer. Pairs are added with addPair, and
+ * finish marks that no more pairs are coming so the game can complete.
+ */
+function startGame(L1_language, L2_language) {
     const resultsDiv = document.getElementById("results");
     resultsDiv.innerHTML = ""; // Clear previous results
 
     const autoRefresh = document.getElementById("auto-refresh").checked; // Get auto-refresh setting
 
-    // Shuffle words independently for L1 and L2
-    const L1_words = pairs.map(pair => pair.L1);
-    const L2_words = pairs.map(pair => pair.L2);
-    const shuffledL1 = shuffleArray([...L1_words]);
-    const shuffledL2 = shuffleArray([...L2_words]);
-
-    const L1Buttons = createButtons(shuffledL1, "L1");
-    const L2Buttons = createButtons(shuffledL2, "L2");
-
     resultsDiv.innerHTML = `
         <div class="columns">
             <div class="column">
                 <h3>${L1_language}</h3>
-                <div class="button-group">${L1Buttons}</div>
+                <div class="button-group" id="L1-buttons"></div>
             </div>
             <div class="column">
                 <h3>${L2_language}</h3>
-                <div class="button-group">${L2Buttons}</div>
+                <div class="button-group" id="L2-buttons"></div>
             </div>
         </div>
         <p id="status-message"></p>
         <p id="timer">Time: 0:00</p>
     `;
 
+    const L1Group = document.getElementById("L1-buttons");
+    const L2Group = document.getElementById("L2-buttons");
+    const pairs = [];
+    let finished = false;
+
     let timerInterval, startTime = startTimer();
 
-    attachButtonHandlers(pairs, () => {
+    const completeGame = () => {
         clearInterval(timerInterval); // Stop timer
         const secondsElapsed = Math.floor((Date.now() - startTime) / 1000);
         displaySuccess(`All pairs matched in ${formatTime(secondsElapsed)}.`);
@@ -78,7 +213,28 @@ function initializeGame(pairs, L1_language, L2_language) {
                 document.getElementById("language-pair-form").dispatchEvent(new Event("submit"));
             }, 1000); // Delay before fetching new words
         }
+    };
+
+    const matcher = createMatcher(pairs, () => {
+        if (finished) {
+            completeGame();
+        } else {
+            displayMessage("Correct! More pairs are on the way.", "green");
+        }
     });
+
+    return {
+        addPair(pair) {
+            pairs.push(pair);
+            // Inserting each word at a random position keeps both columns shuffled independently
+            insertAtRandom(L1Group, matcher.bind(createButton(pair.L1, "L1")));
+            insertAtRandom(L2Group, matcher.bind(createButton(pair.L2, "L2")));
+        },
+        finish() {
+            finished = true;
+            if (pairs.length > 0 && matcher.allMatched()) completeGame();
+        },
+    };
 }
 
 /**
@@ -97,24 +253,33 @@ function addGame(L1, L2, n, reading_level) {
 }
 
 /**
- * Create buttons for a shuffled array of words.
+ * Create a button for a single word.
  */
-function createButtons(words, side) {
-    return words
-        .map(word => `<button class="word-btn" data-side="${side}" data-word="${word}">${word}</button>`)
-        .join(" ");
+function createButton(word, side) {
+    const button = document.createElement("button");
+    button.className = "word-btn";
+    button.dataset.side = side;
+    button.dataset.word = word;
+    button.textContent = word;
+    return button;
 }
 
 /**
- * Attach handlers to buttons for game logic.
+ * Insert an element at a random position among a container's children.
  */
-function attachButtonHandlers(pairs, onGameComplete) {
-    const buttons = document.querySelectorAll(".word-btn");
-    const statusMessage = document.getElementById("status-message");
+function insertAtRandom(container, element) {
+    const index = Math.floor(Math.random() * (container.children.length + 1));
+    container.insertBefore(element, container.children[index] || null);
+}
+
+/**
+ * Track game logic for buttons as they are added to the board.
+ */
+function createMatcher(pairs, onAllMatched) {
     let activeWord = null;
     let correctMatches = 0;
 
-    buttons.forEach(button => {
+    function bind(button) {
         button.addEventListener("click", () => {
             const side = button.dataset.side;
             const word = button.dataset.word;
@@ -130,7 +295,7 @@ function attachButtonHandlers(pairs, onGameComplete) {
                     correctMatches++;
 
                     if (correctMatches === pairs.length) {
-                        onGameComplete();
+                        onAllMatched();
                     } else {
                         displayMessage("Correct! Keep going.", "green");
                     }
@@ -141,7 +306,8 @@ function attachButtonHandlers(pairs, onGameComplete) {
                 }
             }
         });
-    });
+        return button;
+    }
 
     function setActiveWord(button, side, word) {
         activeWord = { side, word, element: button };
@@ -153,6 +319,8 @@ function attachButtonHandlers(pairs, onGameComplete) {
         activeWord = { side, word, element: button };
         button.classList.add("active");
     }
+
+    return { bind, allMatched: () => correctMatches === pairs.length };
 }
 
 /**
@@ -0,0 +1,257 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import asyncio
+import openai
+import random
+import threading
+import time
+
+# Errors worth retrying; anything else (bad request, auth, refusal) fails straight away
+TRANSIENT_ERRORS = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class HedgedCaller:
+    """Deadline-aware upstream calls with hedging and jittered retries.
+
+    `attempt(model, timeout)` makes one upstream call. If it hasn't answered
+    after the `hedge_percentile` latency of recent calls (or `hedge_delay`
+    until `min_samples` calls have been seen), a duplicate is fired at
+    `hedge_model` and whichever succeeds first wins. Transient errors are
+    retried with full-jitter exponential backoff, and everything, including
+    retries, must finish within `deadline` seconds. A request that makes
+    several calls takes one `new_deadline()` up front and passes it to each,
+    so they share that budget instead of getting a fresh one apiece.
+
+    Async losers are cancelled. A sync call can't be interrupted once started,
+    so the loser runs out its own timeout on an executor thread; at most
+    `max_sync_hedges` sync hedges are outstanding, and later ones are skipped.
+    Every primary feeds the hedge percentile, including ones that lose to the
+    hedge; one cut short by the hedge or the deadline counts the time it ran.
+    """
+
+    def __init__(self, model, hedge_model=None, deadline=30.0, hedge_percentile=90, hedge_delay=10.0,
+                 min_hedge_delay=1.0, max_retries=2, backoff=0.5, window=200, min_samples=20, max_workers=32,
+                 max_sync_hedges=4):
+        self.model = model
+        self.hedge_model = hedge_model or model
+        self.deadline = deadline
+        self.hedge_percentile = hedge_percentile
+        self.hedge_delay = hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.min_samples = min_samples
+
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="upstream")
+        self._sync_hedges = threading.BoundedSemaphore(max_sync_hedges)
+        self._stats = {
+            "calls": 0,
+            "hedges": 0,
+            "hedges_skipped": 0,
+            "hedge_wins": 0,
+            "primary_wins": 0,
+            "retries": 0,
+            "deadline_exceeded": 0,
+        }
+
+    def call(self, attempt, deadline=None):
+        """Run `attempt` by `deadline` (absolute, from `new_deadline()`), or `self.deadline` seconds from now."""
+        if deadline is None:
+            deadline = self.new_deadline()
+        self.remaining(deadline)
+        self._count("calls")
+        for retry in range(self.max_retries + 1):
+            try:
+                return self._race(attempt, deadline)
+            except TRANSIENT_ERRORS as e:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise self.deadline_exceeded() from e
+                if retry == self.max_retries:
+                    raise
+                self._count("retries")
+                time.sleep(min(remaining, self._backoff(retry)))
+
+    async def acall(self, attempt, deadline=None, hedge_slot=None):
+        """Async version of `call`; `attempt` is a coroutine function and losers are cancelled.
+
+        `hedge_slot`, if given, is a coroutine function returning a reservation
+        (with `release()`) for the hedge's own concurrency slot, or None when
+        none is free, in which case the call isn't hedged.
+        """
+        if deadline is None:
+            deadline = self.new_deadline()
+        self.remaining(deadline)
+        self._count("calls")
+        for retry in range(self.max_retries + 1):
+            try:
+                return await self._arace(attempt, deadline, hedge_slot)
+            except TRANSIENT_ERRORS as e:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise self.deadline_exceeded() from e
+                if retry == self.max_retries:
+                    raise
+                self._count("retries")
+                await asyncio.sleep(min(remaining, self._backoff(retry)))
+
+    def new_deadline(self):
+        return time.monotonic() + self.deadline
+
+    def remaining(self, deadline):
+        """Seconds left until `deadline`; raises DeadlineExceeded once it has passed."""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise self.deadline_exceeded()
+        return remaining
+
+    def deadline_exceeded(self):
+        self._count("deadline_exceeded")
+        return DeadlineExceeded(f"Upstream did not answer within {self.deadline:g}s")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["hedge_win_rate"] = stats["hedge_wins"] / stats["hedges"] if stats["hedges"] else 0.0
+        stats["current_hedge_delay"] = self.current_hedge_delay()
+        return stats
+
+    def current_hedge_delay(self):
+        if not self.hedge_percentile:
+            return None
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < self.min_samples:
+            return self.hedge_delay
+        index = min(len(samples) - 1, int(len(samples) * self.hedge_percentile / 100))
+        return max(self.min_hedge_delay, samples[index])
+
+    def _race(self, attempt, deadline):
+        def timed(model, primary):
+            start = time.monotonic()
+            try:
+                result = attempt(model, max(deadline - start, 0.001))
+            except openai.APITimeoutError:
+                if primary:
+                    self._record_latency(time.monotonic() - start)
+                raise
+            latency = time.monotonic() - start
+            if primary:
+                self._record_latency(latency)
+            return result, latency
+
+        primary = self._executor.submit(timed, self.model, True)
+        pending = {primary}
+        delay = self.current_hedge_delay()
+        hedge_at = time.monotonic() + delay if delay is not None else None
+        error = None
+
+        while pending:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            timeout = deadline - now
+            if hedge_at is not None:
+                timeout = min(timeout, max(hedge_at - now, 0))
+
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                result, _ = future.result()
+                # A sync call can't be interrupted once started; the loser runs out its own timeout.
+                for other in pending:
+                    other.cancel()
+                self._count("primary_wins" if future is primary else "hedge_wins")
+                return result
+
+            if hedge_at is not None and pending and time.monotonic() >= hedge_at:
+                hedge_at = None
+                if self._sync_hedges.acquire(blocking=False):
+                    self._count("hedges")
+                    hedge = self._executor.submit(timed, self.hedge_model, False)
+                    hedge.add_done_callback(lambda _: self._sync_hedges.release())
+                    pending.add(hedge)
+                else:
+                    self._count("hedges_skipped")
+
+        if error is not None and not pending:
+            raise error
+        raise self.deadline_exceeded()
+
+    async def _arace(self, attempt, deadline, hedge_slot):
+        async def timed(model, primary):
+            start = time.monotonic()
+            try:
+                result = await attempt(model, max(deadline - start, 0.001))
+            except (asyncio.CancelledError, openai.APITimeoutError):
+                if primary:
+                    self._record_latency(time.monotonic() - start)
+                raise
+            latency = time.monotonic() - start
+            if primary:
+                self._record_latency(latency)
+            return result, latency
+
+        primary = asyncio.ensure_future(timed(self.model, True))
+        pending = {primary}
+        delay = self.current_hedge_delay()
+        hedge_at = time.monotonic() + delay if delay is not None else None
+        error = None
+
+        try:
+            while pending:
+                now = time.monotonic()
+                if now >= deadline:
+                    break
+                timeout = deadline - now
+                if hedge_at is not None:
+                    timeout = min(timeout, max(hedge_at - now, 0))
+
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    result, _ = task.result()
+                    self._count("primary_wins" if task is primary else "hedge_wins")
+                    return result
+
+                if hedge_at is not None and pending and time.monotonic() >= hedge_at:
+                    hedge_at = None
+                    reservation = await hedge_slot() if hedge_slot is not None else None
+                    if hedge_slot is None or reservation is not None:
+                        self._count("hedges")
+                        hedge = asyncio.ensure_future(timed(self.hedge_model, False))
+                        if reservation is not None:
+                            # A done callback runs even if the hedge is cancelled before it starts
+                            hedge.add_done_callback(lambda _: reservation.release())
+                        pending.add(hedge)
+                    else:
+                        self._count("hedges_skipped")
+        finally:
+            for task in pending:
+                task.cancel()
+
+        if error is not None and not pending:
+            raise error
+        raise self.deadline_exceeded()
+
+    def _record_latency(self, latency):
+        # Only primary latencies feed the hedge percentile; the hedge model may be much faster.
+        with self._lock:
+            self._latencies.append(latency)
+
+    def _backoff(self, retry):
+        return random.uniform(0, self.backoff * 2 ** retry)
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
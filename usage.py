@@ -0,0 +1,49 @@
+import threading
+
+
+class UsageTracker:
+    """Running totals of token usage and latency for upstream model calls, per call kind."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}
+
+    def record(self, kind, usage, latency, first_token_latency=None):
+        prompt_tokens = usage.prompt_tokens if usage else 0
+        completion_tokens = usage.completion_tokens if usage else 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = (details.cached_tokens or 0) if details else 0
+
+        with self._lock:
+            totals = self._totals.setdefault(kind, {
+                "calls": 0,
+                "prompt_tokens": 0,
+                "cached_tokens": 0,
+                "completion_tokens": 0,
+                "latency_seconds": 0.0,
+                "first_token_calls": 0,
+                "first_token_seconds": 0.0,
+            })
+            totals["calls"] += 1
+            totals["prompt_tokens"] += prompt_tokens
+            totals["cached_tokens"] += cached_tokens
+            totals["completion_tokens"] += completion_tokens
+            totals["latency_seconds"] += latency
+            if first_token_latency is not None:
+                totals["first_token_calls"] += 1
+                totals["first_token_seconds"] += first_token_latency
+
+    def stats(self):
+        with self._lock:
+            stats = {}
+            for kind, totals in self._totals.items():
+                calls = totals["calls"]
+                stats[kind] = {
+                    **totals,
+                    "cached_ratio": totals["cached_tokens"] / totals["prompt_tokens"] if totals["prompt_tokens"] else 0.0,
+                    "mean_latency_seconds": totals["latency_seconds"] / calls,
+                    "mean_first_token_seconds": (
+                        totals["first_token_seconds"] / totals["first_token_calls"] if totals["first_token_calls"] else None
+                    ),
+                }
+            return stats